@@ -17,6 +17,10 @@ Affinization Crystals
 #                  http://www.gnu.org/licenses/
 #****************************************************************************
 
+import weakref
+
+from sage.misc.cachefunc import cached_method
+from sage.misc.lazy_attribute import lazy_attribute, lazy_class_attribute
 from sage.structure.parent import Parent
 from sage.structure.unique_representation import UniqueRepresentation
 from sage.structure.element import Element
@@ -24,6 +28,10 @@ from sage.categories.regular_crystals import RegularCrystals
 from sage.categories.infinite_enumerated_sets import InfiniteEnumeratedSets
 from sage.rings.infinity import Infinity
 
+# Sentinel for the crystal operator caches below; it must be distinct
+# from ``None``, which is a valid cached result.
+_SENTINEL = object()
+
 class AffinizationOfCrystal(UniqueRepresentation, Parent):
     r"""
     An affiniziation of a crystal.
@@ -72,6 +80,21 @@ class AffinizationOfCrystal(UniqueRepresentation, Parent):
 
     - [HK02]_ Chapter 10
     """
+    @lazy_class_attribute
+    def _default_category(cls):
+        """
+        The category of all affinization crystals, built once for the
+        class rather than on every construction.
+
+        EXAMPLES::
+
+            sage: A = crystals.KirillovReshetikhin(['A',2,1], 1, 1).affinization()
+            sage: A2 = crystals.KirillovReshetikhin(['C',2,1], 1, 1).affinization()
+            sage: A.category() is A2.category()
+            True
+        """
+        return (RegularCrystals(), InfiniteEnumeratedSets())
+
     def __init__(self, B):
         """
         Initialize ``self``.
@@ -83,15 +106,20 @@ class AffinizationOfCrystal(UniqueRepresentation, Parent):
             sage: A = crystals.KirillovReshetikhin(['A',2,1], 2, 2).affinization()
             sage: TestSuite(A).run(skip="_test_stembridge_local_axioms") # long time
         """
-        if not B.cartan_type().is_affine():
+        ct = B.cartan_type()
+        if not ct.is_affine():
             raise ValueError("must be an affine crystal")
         if B.cardinality() == Infinity:
             raise ValueError("must be finite crystal")
         self._B = B
-        self._cartan_type = B.cartan_type()
-        Parent.__init__(self, category=(RegularCrystals(), InfiniteEnumeratedSets()))
-        mg_elt = lambda b: self.element_class(self, b, 0)
-        self.module_generators = tuple(map(mg_elt, B.module_generators))
+        self._cartan_type = ct
+        Parent.__init__(self, category=self._default_category)
+        # Cache the (dynamic) element class for the constructor calls in
+        # _element below.
+        self._cls = self.element_class
+        self._elt_cache = weakref.WeakValueDictionary()
+        self.module_generators = tuple(self._element(b, 0)
+                                       for b in B.module_generators)
 
     def _repr_(self):
         """
@@ -104,6 +132,75 @@ class AffinizationOfCrystal(UniqueRepresentation, Parent):
         """
         return "Affinization of {}".format(self._B)
 
+    def _element(self, b, m):
+        """
+        Return the element ``b(m)`` of ``self``.
+
+        Repeated constructions of the same element return the same
+        object, so traversals which revisit an element share a single
+        allocation and its equality checks short-circuit on identity.
+
+        .. WARNING::
+
+            The returned element is shared between all callers and must
+            be treated as immutable; mutating ``_b`` or ``_m`` in place
+            (e.g. via ``__setstate__``) would corrupt every element the
+            cache hands out under that key.
+
+        EXAMPLES::
+
+            sage: A = crystals.KirillovReshetikhin(['A',2,1], 2, 2).affinization()
+            sage: mg = A.module_generators[0]
+            sage: A._element(mg._b, 0) is mg
+            True
+        """
+        key = (b, m)
+        elt = self._elt_cache.get(key)
+        if elt is None:
+            elt = self._cls(self, b, m)
+            self._elt_cache[key] = elt
+        return elt
+
+    @lazy_attribute
+    def _wlr(self):
+        """
+        The weight lattice realization of ``self``, cached here for use
+        in :meth:`Element.weight`.
+
+        EXAMPLES::
+
+            sage: A = crystals.KirillovReshetikhin(['A',2,1], 1, 1).affinization()
+            sage: A._wlr
+            Extended weight lattice of the Root system of type ['A', 2, 1]
+        """
+        return self.cartan_type().root_system().weight_lattice(extended=True)
+
+    @lazy_attribute
+    def _fund_weights(self):
+        """
+        The fundamental weights of :meth:`weight_lattice_realization`.
+
+        EXAMPLES::
+
+            sage: A = crystals.KirillovReshetikhin(['A',2,1], 1, 1).affinization()
+            sage: A._fund_weights
+            Finite family {0: Lambda[0], 1: Lambda[1], 2: Lambda[2]}
+        """
+        return self._wlr.fundamental_weights()
+
+    @lazy_attribute
+    def _null_root(self):
+        """
+        The null root `\\delta` of :meth:`weight_lattice_realization`.
+
+        EXAMPLES::
+
+            sage: A = crystals.KirillovReshetikhin(['A',2,1], 1, 1).affinization()
+            sage: A._null_root
+            delta
+        """
+        return self._wlr.null_root()
+
     def weight_lattice_realization(self):
         """
         Return the weight lattice realization of ``self``.
@@ -114,7 +211,24 @@ class AffinizationOfCrystal(UniqueRepresentation, Parent):
             sage: A.weight_lattice_realization()
             Extended weight lattice of the Root system of type ['A', 2, 1]
         """
-        return self.cartan_type().root_system().weight_lattice(extended=True)
+        return self._wlr
+
+    @cached_method
+    def _underlying_digraph_edges(self):
+        """
+        Return the outgoing edges of the crystal graph of the underlying
+        finite crystal, as a dict ``{b: [(f_i b, i), ...]}``.
+
+        EXAMPLES::
+
+            sage: A = crystals.KirillovReshetikhin(['A',2,1], 1, 1).affinization()
+            sage: sorted(len(out) for out in A._underlying_digraph_edges().values())
+            [1, 1, 1]
+        """
+        edges = {}
+        for u, v, i in self._B.digraph().edges():
+            edges.setdefault(u, []).append((v, i))
+        return edges
 
     # TODO: This should become unnecessary once we have a proper category for KR crystals
     def digraph(self, subset=None, index_set=None):
@@ -123,22 +237,85 @@ class AffinizationOfCrystal(UniqueRepresentation, Parent):
         :meth:`~sage.categories.crystals.ParentMethods.digraph()` for more
         information.
 
+        The `B`-level transitions do not depend on the grading `m`, so
+        when ``subset`` consists of elements of ``self``, the edges are
+        lifted from the (cached) crystal graph of the underlying finite
+        crystal rather than recomputed by applying the crystal operators
+        to every vertex.
+
         EXAMPLES::
 
             sage: A = crystals.KirillovReshetikhin(['A',2,1], 2, 2).affinization()
             sage: S = A.subcrystal(max_depth=3)
             sage: G = A.digraph(subset=S)
+
+        We check the lifted edges against a subset computed by hand for
+        `B^{1,1}` of type `A_2^{(1)}`, whose crystal graph is the
+        `3`-cycle `1 \to 2 \to 3 \to 1` with arrows `1`, `2`, `0`::
+
+            sage: A = crystals.KirillovReshetikhin(['A',2,1], 1, 1).affinization()
+            sage: mg = A.module_generators[0]
+            sage: S = [mg, mg.f(1), mg.f(1).f(2), mg.e(0), mg.e(0).e(2)]
+            sage: G = A.digraph(subset=S)
+            sage: G.num_verts(), G.num_edges()
+            (5, 4)
+            sage: sorted(G.edges(), key=str)
+            [([[1]](0), [[2]](0), 1),
+             ([[2]](0), [[3]](0), 2),
+             ([[2]](1), [[3]](1), 2),
+             ([[3]](1), [[1]](0), 0)]
+            sage: A.digraph(subset=S, index_set=[1]).num_edges()
+            1
+
+        The generic construction on the corresponding subcrystal, whose
+        vertices wrap the elements above, gives a graph of the same
+        shape::
+
+            sage: G2 = A.digraph(subset=A.subcrystal(max_depth=2))
+            sage: G2.num_verts(), G2.num_edges()
+            (5, 4)
         """
-        G = super(AffinizationOfCrystal, self).digraph(subset, index_set)
         from sage.graphs.dot2tex_utils import have_dot2tex
+        if subset is not None:
+            subset = list(subset)
+        if subset is None or not all(isinstance(x, self._cls) for x in subset):
+            # Lifting needs the _b and _m coordinates, so anything else
+            # (e.g. a Subcrystal, whose elements wrap those of ``self``)
+            # goes through the generic construction.
+            G = super(AffinizationOfCrystal, self).digraph(subset, index_set)
+            if have_dot2tex():
+                G.set_latex_options(edge_options=lambda uvl: {})
+            return G
+
+        from sage.graphs.all import DiGraph
+        if index_set is None:
+            index_set = self.index_set()
+        edges = self._underlying_digraph_edges()
+        vertices = set(subset)
+        d = {}
+        for x in subset:
+            dx = d[x] = {}
+            m = x._m
+            for b, i in edges.get(x._b, ()):
+                if i not in index_set:
+                    continue
+                child = self._element(b, m - (i == 0))
+                if child in vertices:
+                    dx[child] = i
+        G = DiGraph(d)
         if have_dot2tex():
-            G.set_latex_options(edge_options = lambda (u,v,label): ({}))
+            G.set_latex_options(format="dot2tex",
+                                edge_labels=True,
+                                color_by_label=self.cartan_type()._index_set_coloring,
+                                edge_options=lambda uvl: {})
         return G
 
     class Element(Element):
         """
         An element in an affinization crystal.
         """
+        __slots__ = ('_b', '_m', '_ecache', '_fcache')
+
         def __init__(self, parent, b, m):
             """
             Initialize ``self``.
@@ -151,8 +328,63 @@ class AffinizationOfCrystal(UniqueRepresentation, Parent):
             """
             self._b = b
             self._m = m
+            self._ecache = None
+            self._fcache = None
             Element.__init__(self, parent)
 
+        def __getstate__(self):
+            """
+            Return the state of ``self`` for pickling.
+
+            This is needed since ``self`` stores its data in ``__slots__``
+            rather than in a ``__dict__``.
+
+            EXAMPLES::
+
+                sage: A = crystals.KirillovReshetikhin(['A',2,1], 2, 2).affinization()
+                sage: mg = A.module_generators[0]
+                sage: loads(dumps(mg)) == mg
+                True
+            """
+            return (self.parent(), {'_b': self._b, '_m': self._m})
+
+        def __setstate__(self, state):
+            """
+            Set the state of ``self`` from a pickle.
+
+            EXAMPLES::
+
+                sage: A = crystals.KirillovReshetikhin(['A',2,1], 2, 2).affinization()
+                sage: mg = A.module_generators[0]
+                sage: elt = loads(dumps(mg))
+                sage: elt.__setstate__((A, {'_b': mg._b, '_m': 1})); elt
+                [[1, 1], [2, 2]](1)
+            """
+            self._set_parent(state[0])
+            self._ecache = None
+            self._fcache = None
+            for key, val in state[1].iteritems():
+                setattr(self, key, val)
+
+        def __copy__(self):
+            """
+            Return a copy of ``self``.
+
+            The generic ``Element.__copy__`` only copies the instance
+            ``__dict__``, which no longer holds the data since ``self``
+            uses ``__slots__``. Elements are interned and immutable (see
+            :meth:`AffinizationOfCrystal._element`), so ``self`` is its
+            own copy.
+
+            EXAMPLES::
+
+                sage: A = crystals.KirillovReshetikhin(['A',2,1], 2, 2).affinization()
+                sage: mg = A.module_generators[0]
+                sage: copy(mg) is mg
+                True
+            """
+            return self
+
         def _repr_(self):
             """
             Return a string representation of ``self``.
@@ -187,6 +419,23 @@ class AffinizationOfCrystal(UniqueRepresentation, Parent):
             from sage.misc.latex import latex
             return latex(self._b) + "({})".format(self._m)
 
+        def __hash__(self):
+            """
+            Return the hash of ``self``.
+
+            The hash agrees with ``__eq__`` and, unlike the generic
+            ``Element.__hash__``, does not build the string
+            representation of ``self`` on every call.
+
+            EXAMPLES::
+
+                sage: A = crystals.KirillovReshetikhin(['A',2,1], 2, 2).affinization()
+                sage: mg = A.module_generators[0]
+                sage: hash(mg) == hash(mg.f(2).e(2))
+                True
+            """
+            return hash((self._m, self._b))
+
         def __eq__(self, other):
             """
             Check equality.
@@ -204,10 +453,13 @@ class AffinizationOfCrystal(UniqueRepresentation, Parent):
                 sage: A(KT.module_generators[3], 1).f(0) == A.module_generators[0]
                 True
             """
-            if not isinstance(other, AffinizationOfCrystal.Element):
+            if self is other:
+                return True
+            if type(self) is not type(other):
                 return False
-            return self.parent() == other.parent() \
-                    and self._b == other._b and self._m == other._m
+            return (self._m == other._m
+                    and self.parent() is other.parent()
+                    and self._b == other._b)
 
         def __ne__(self, other):
             """
@@ -222,7 +474,7 @@ class AffinizationOfCrystal(UniqueRepresentation, Parent):
                 sage: mg != mg.f(2).e(2)
                 False
             """
-            return not self.__eq__(other)
+            return not self == other
 
         def __lt__(self, other):
             """
@@ -242,7 +494,7 @@ class AffinizationOfCrystal(UniqueRepresentation, Parent):
                  [[1, 2], [3, 3]](1),
                  [[2, 2], [3, 3]](2)]
             """
-            return self._m < other._m or (self._m == other._m and self._b < other._b)
+            return (self._m, self._b) < (other._m, other._b)
 
         def e(self, i):
             """
@@ -262,12 +514,16 @@ class AffinizationOfCrystal(UniqueRepresentation, Parent):
                 sage: mg.e(0).e(1)
                 [[1, 1], [2, 3]](1)
             """
-            bp = self._b.e(i)
+            cache = self._ecache
+            if cache is None:
+                cache = self._ecache = {}
+            bp = cache.get(i, _SENTINEL)
+            if bp is _SENTINEL:
+                bp = self._b.e(i)
+                cache[i] = bp
             if bp is None:
                 return None
-            if i == 0:
-                return self.__class__(self.parent(), bp, self._m+1)
-            return self.__class__(self.parent(), bp, self._m)
+            return self.parent()._element(bp, self._m + (i == 0))
 
         def f(self, i):
             """
@@ -290,12 +546,16 @@ class AffinizationOfCrystal(UniqueRepresentation, Parent):
                 sage: mg.f_string([2,1,0])
                 [[1, 1], [2, 2]](-1)
             """
-            bp = self._b.f(i)
+            cache = self._fcache
+            if cache is None:
+                cache = self._fcache = {}
+            bp = cache.get(i, _SENTINEL)
+            if bp is _SENTINEL:
+                bp = self._b.f(i)
+                cache[i] = bp
             if bp is None:
                 return None
-            if i == 0:
-                return self.__class__(self.parent(), bp, self._m-1)
-            return self.__class__(self.parent(), bp, self._m)
+            return self.parent()._element(bp, self._m - (i == 0))
 
         def epsilon(self, i):
             r"""
@@ -358,7 +618,7 @@ class AffinizationOfCrystal(UniqueRepresentation, Parent):
                 sage: mg.e(0).e(0).weight()
                 2*Lambda[0] - 2*Lambda[1] + 2*delta
             """
-            WLR = self.parent().weight_lattice_realization()
-            La = WLR.fundamental_weights()
-            return WLR.sum(c*La[i] for i,c in self._b.weight()) + self._m * WLR.null_root()
+            P = self.parent()
+            La = P._fund_weights
+            return P._wlr.sum(c*La[i] for i,c in self._b.weight()) + self._m * P._null_root
 